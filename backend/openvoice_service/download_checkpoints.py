@@ -1,5 +1,7 @@
 import os
-import requests
+import asyncio
+import aiofiles
+import httpx
 from pathlib import Path
 import logging
 
@@ -7,17 +9,93 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def download_file(url, destination):
-    """Download a file from a URL to a destination path."""
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+# Read and write the response in 4 MiB chunks
+CHUNK_SIZE = 4 * 1024 * 1024
+
+def drop_page_cache(path):
+    """Ask the kernel to evict a freshly written file from the page cache."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Only clean pages can be dropped, so flush the written data first
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+async def download_file(client, url, destination):
+    """Download a file from a URL to a destination path, resuming a previous partial download."""
+    partial = destination.with_name(destination.name + ".part")
+    offset = partial.stat().st_size if partial.exists() else 0
+    # Ask for the raw bytes so the file on disk lines up with Range offsets
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    
+    async with client.stream("GET", url, headers=headers, follow_redirects=True) as response:
+        if response.status_code == 416:
+            # "Content-Range: bytes */N" gives the full size; a partial file of that
+            # size was finished before an earlier run could move it into place
+            total = response.headers.get("content-range", "").rpartition("/")[2]
+            if total.isdigit() and int(total) == offset:
+                logger.info(f"{destination.name} was already fully downloaded")
+            else:
+                # The partial file doesn't match the remote one any more, start over
+                partial.unlink()
+                return await download_file(client, url, destination)
+        else:
+            response.raise_for_status()
+            
+            # Append only if the server honoured the range request
+            if response.status_code == 206:
+                logger.info(f"Resuming {destination.name} from byte {offset}")
+                mode = 'ab'
+            else:
+                mode = 'wb'
+            async with aiofiles.open(partial, mode) as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await f.write(chunk)
     
-    with open(destination, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
+    os.replace(partial, destination)
+    
+    # The checkpoint is loaded later by the service, no need to keep it cached now
+    drop_page_cache(destination)
+
+async def is_complete_checkpoint(client, url, destination):
+    """Check that an existing checkpoint has the size the server reports."""
+    try:
+        response = await client.head(url, headers={"Accept-Encoding": "identity"}, follow_redirects=True)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        # Without an answer from the server, trust the file that is already there
+        logger.warning(f"Could not check the size of {destination.name}, keeping existing file: {e}")
+        return True
+    expected = response.headers.get("content-length")
+    return expected is None or int(expected) == destination.stat().st_size
 
-def main():
+async def download_checkpoint(client, filename, url, destination):
+    """Download a single checkpoint unless a complete copy exists, logging the outcome."""
+    try:
+        if destination.exists():
+            if await is_complete_checkpoint(client, url, destination):
+                logger.info(f"{filename} already exists, skipping...")
+                return
+            # Left truncated by an earlier run; resume it like any partial download
+            logger.warning(f"{filename} is incomplete, resuming download...")
+            partial = destination.with_name(destination.name + ".part")
+            if partial.exists():
+                destination.unlink()
+            else:
+                os.replace(destination, partial)
+        
+        logger.info(f"Downloading {filename}...")
+        await download_file(client, url, destination)
+        logger.info(f"Successfully downloaded {filename}")
+    except Exception as e:
+        logger.error(f"Failed to download {filename}: {e}")
+
+async def main():
     # Create checkpoints directory if it doesn't exist
     checkpoint_dir = Path("OpenVoice/checkpoints")
     checkpoint_dir.mkdir(parents=True, exist_ok=True)
@@ -28,18 +106,12 @@ def main():
         "config.json": "https://huggingface.co/myshell-ai/OpenVoice/resolve/main/checkpoints/config.json"
     }
     
-    # Download each checkpoint file
-    for filename, url in checkpoint_urls.items():
-        destination = checkpoint_dir / filename
-        if not destination.exists():
-            logger.info(f"Downloading {filename}...")
-            try:
-                download_file(url, destination)
-                logger.info(f"Successfully downloaded {filename}")
-            except Exception as e:
-                logger.error(f"Failed to download {filename}: {e}")
-        else:
-            logger.info(f"{filename} already exists, skipping...")
+    # Download all missing or corrupt checkpoint files concurrently
+    async with httpx.AsyncClient(http2=True, timeout=None) as client:
+        await asyncio.gather(*[
+            download_checkpoint(client, filename, url, checkpoint_dir / filename)
+            for filename, url in checkpoint_urls.items()
+        ])
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
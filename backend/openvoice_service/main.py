@@ -1,20 +1,22 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 import os
-import shutil
+import asyncio
+import hashlib
+import io
+import tempfile
 from pathlib import Path
 import torch
 import torchaudio
+import torchaudio.functional as AF
 import numpy as np
 from typing import Optional
 import json
 import sys
 import subprocess
 import logging
-import librosa
-import io
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -35,9 +37,25 @@ MODEL_DIR = Path("models")
 UPLOAD_DIR.mkdir(exist_ok=True)
 MODEL_DIR.mkdir(exist_ok=True)
 
+# Scratch space for uploaded voice samples, kept in RAM (tmpfs) when available
+TEMP_DIR = Path("/dev/shm") if Path("/dev/shm").is_dir() else None
+
+# Generated speech cache, keyed by voice and text; partial outputs live in a subdirectory
+# on the same filesystem so finished files can be moved in atomically
+TTS_CACHE_DIR = (TEMP_DIR or UPLOAD_DIR) / "tts_cache"
+TTS_CACHE_PARTIAL_DIR = TTS_CACHE_DIR / "partial"
+TTS_CACHE_PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+TTS_CACHE_MAX_FILES = 500
+
 # Initialize OpenVoice models
+device = "cuda" if torch.cuda.is_available() else "cpu"
 base_speaker_tts = None
 tone_color_converter = None
+source_se = None
+voices_json = None
+eager_infer = None
+eager_voice_conversion = None
+models_compiled = False
 try:
     logger.info("Attempting to import OpenVoice...")
     from openvoice.api import BaseSpeakerTTS, ToneColorConverter
@@ -55,7 +73,6 @@ try:
     if (ckpt_base.exists() and any(ckpt_base.iterdir())) and \
        (ckpt_converter.exists() and any(ckpt_converter.iterdir())):
         logger.info("Found model checkpoints. Initializing OpenVoice models...")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
         
         # Initialize base speaker TTS
         base_speaker_tts = BaseSpeakerTTS(
@@ -71,6 +88,40 @@ try:
         )
         tone_color_converter.load_ckpt(str(ckpt_converter / "checkpoint.pth"))
         
+        # Run both models in half precision on GPU
+        if device == "cuda":
+            base_speaker_tts.model.half()
+            tone_color_converter.model.half()
+        
+        # Load the base speaker embedding once, already on the model device
+        source_se = torch.load(str(ckpt_base / "en_default_se.pth"), map_location=device)
+        if device == "cuda":
+            source_se = source_se.half()
+        
+        # Compile the inference entry points; compilation is lazy, so the warmup at
+        # startup triggers it and falls back to the eager methods kept here if it fails
+        if device == "cuda":
+            eager_infer = base_speaker_tts.model.infer
+            eager_voice_conversion = tone_color_converter.model.voice_conversion
+            try:
+                base_speaker_tts.model.infer = torch.compile(eager_infer, dynamic=True)
+                tone_color_converter.model.voice_conversion = torch.compile(
+                    eager_voice_conversion, dynamic=True
+                )
+                models_compiled = True
+            except Exception as e:
+                logger.warning(f"torch.compile unavailable, running eager models: {e}")
+                base_speaker_tts.model.infer = eager_infer
+                tone_color_converter.model.voice_conversion = eager_voice_conversion
+        
+        # Build the /voices response once from the model's hps
+        voices = [
+            {"id": voice_id, "name": voice_id}
+            for voice_id in base_speaker_tts.hps.speakers.keys()
+        ]
+        logger.info(f"Available voices: {voices}")
+        voices_json = json.dumps({"voices": voices}).encode()
+        
         logger.info("OpenVoice models initialized successfully!")
     else:
         logger.error("No valid checkpoints found in either base speakers or converter directories")
@@ -94,6 +145,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def warmup_models():
+    # Run one TTS + conversion pass so compilation happens before the first request;
+    # eager models (e.g. on CPU) have nothing to warm up
+    if not models_compiled:
+        return
+    # Unique names, since several workers warm up at the same time
+    src_path = UPLOAD_DIR / f"warmup_src_{os.urandom(4).hex()}.wav"
+    output_path = UPLOAD_DIR / f"warmup_out_{os.urandom(4).hex()}.wav"
+    try:
+        logger.info("Warming up OpenVoice models...")
+        run_inference(
+            base_speaker_tts.tts,
+            text="Warming up the voice models.",
+            output_path=str(src_path),
+            speaker='default',
+            language='English',
+            speed=1.0
+        )
+        run_inference(
+            tone_color_converter.convert,
+            audio_src_path=str(src_path),
+            src_se=source_se,
+            tgt_se=source_se,
+            output_path=str(output_path),
+            message="@MyShell"
+        )
+        logger.info("OpenVoice warmup complete")
+    except Exception as e:
+        # Most likely a compile/backend error, which only surfaces on the first call
+        logger.error(f"OpenVoice warmup failed: {e}")
+        logger.warning("Falling back to eager (uncompiled) models")
+        base_speaker_tts.model.infer = eager_infer
+        tone_color_converter.model.voice_conversion = eager_voice_conversion
+    finally:
+        cleanup_files(src_path, output_path)
+
+def convert_to_wav(data, name, audio_format):
+    """Decode uploaded audio bytes to 16 kHz mono and write them to a temporary WAV."""
+    waveform, sr = torchaudio.load(io.BytesIO(data), format=audio_format)
+    # Downmix first so only one channel gets resampled
+    if waveform.size(0) > 1:
+        waveform = waveform.mean(dim=0, keepdim=True)
+    if sr != 16000:
+        waveform = AF.resample(waveform, sr, 16000, lowpass_filter_width=6)
+    # Save as WAV
+    with tempfile.NamedTemporaryFile(dir=TEMP_DIR, prefix=f"{name}_", suffix=".wav", delete=False) as f:
+        torchaudio.save(f, waveform, 16000, format="wav", encoding="PCM_S", bits_per_sample=16)
+    return Path(f.name)
+
+def run_inference(fn, *args, **kwargs):
+    """Call an OpenVoice model method without autograd, autocasting to FP16 on GPU."""
+    with torch.inference_mode(), torch.autocast(device, dtype=torch.float16, enabled=device == "cuda"):
+        return fn(*args, **kwargs)
+
+def cleanup_files(*paths):
+    """Remove temporary files, logging any failure."""
+    for path in paths:
+        if path and path.exists():
+            try:
+                path.unlink()
+            except Exception as e:
+                logger.error(f"Error cleaning up {path}: {e}")
+
+def tts_cache_path(voice_id, text, embedding_path):
+    """Return the cache file for a voice/text pair."""
+    key = f"{voice_id}|{text}"
+    if embedding_path.exists():
+        # Re-cloning a voice under the same name must not serve stale audio
+        key += f"|{embedding_path.stat().st_mtime_ns}"
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return TTS_CACHE_DIR / f"{digest}.wav"
+
+def store_in_tts_cache(output_path, cache_path):
+    """Move generated speech into the cache and evict least recently used entries."""
+    os.replace(output_path, cache_path)
+    entries = []
+    for path in TTS_CACHE_DIR.glob("*.wav"):
+        try:
+            entries.append((path.stat().st_atime, path))
+        except FileNotFoundError:
+            # Evicted concurrently by another request
+            continue
+    if len(entries) <= TTS_CACHE_MAX_FILES:
+        return
+    entries.sort()
+    cleanup_files(*(path for _, path in entries[:len(entries) - TTS_CACHE_MAX_FILES]))
+
 @app.post("/clone-voice")
 async def clone_voice(
     audio: UploadFile = File(...),
@@ -117,36 +256,26 @@ async def clone_voice(
         if name is None:
             name = f"voice_{os.urandom(4).hex()}"
 
-        # Save the uploaded audio file
-        file_path = UPLOAD_DIR / f"{name}_{audio.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
-        
-        logger.info(f"Processing audio file: {file_path}")
-        
-        # Convert to WAV if needed
-        if not file_path.suffix.lower() == '.wav':
-            wav_path = file_path.with_suffix('.wav')
-            logger.info(f"Converting {file_path} to WAV format...")
-            try:
-                # Load audio with librosa
-                audio_data, sr = librosa.load(str(file_path), sr=16000)
-                # Save as WAV
-                import soundfile as sf
-                sf.write(str(wav_path), audio_data, sr)
-                file_path = wav_path
-                logger.info(f"Successfully converted to WAV: {wav_path}")
-            except Exception as e:
-                logger.error(f"Error converting audio to WAV: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error converting audio to WAV: {str(e)}"
-                )
+        # Read the upload into memory and decode it to a WAV for the embedding extractor
+        data = await audio.read()
+        logger.info(f"Processing audio file: {audio.filename} ({len(data)} bytes)")
+        try:
+            audio_format = Path(audio.filename).suffix.lstrip('.').lower()
+            file_path = await asyncio.to_thread(convert_to_wav, data, name, audio_format)
+            logger.info(f"Successfully converted to WAV: {file_path}")
+        except Exception as e:
+            logger.error(f"Error converting audio to WAV: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error converting audio to WAV: {str(e)}"
+            )
         
         # Extract speaker embedding using the converter model
         try:
             from openvoice import se_extractor
-            target_se, audio_name = se_extractor.get_se(
+            target_se, audio_name = await asyncio.to_thread(
+                run_inference,
+                se_extractor.get_se,
                 str(file_path),
                 tone_color_converter,
                 target_dir=str(UPLOAD_DIR),
@@ -159,11 +288,13 @@ async def clone_voice(
                 status_code=500,
                 detail=f"Error extracting speaker embedding: {str(e)}"
             )
+        finally:
+            cleanup_files(file_path)
         
         # Save the speaker embedding
         embedding_path = UPLOAD_DIR / f"{name}_embedding.pt"
         try:
-            torch.save(target_se, embedding_path)
+            await asyncio.to_thread(torch.save, target_se, embedding_path)
             logger.info(f"Successfully saved speaker embedding: {embedding_path}")
         except Exception as e:
             logger.error(f"Error saving speaker embedding: {e}")
@@ -198,15 +329,28 @@ async def generate_speech(request: SpeechRequest):
         logger.info(f"Received request with voice_id: {request.voice_id}")
         logger.info(f"Text length: {len(request.text)}")
         
-        # Check if this is a custom voice (has an embedding)
+        # Serve repeated requests straight from the cache
         embedding_path = UPLOAD_DIR / f"{request.voice_id}_embedding.pt"
+        cache_path = tts_cache_path(request.voice_id, request.text, embedding_path)
+        try:
+            # Mark the entry as recently used for eviction; raises if it isn't cached
+            os.utime(cache_path)
+            logger.info(f"Serving cached speech: {cache_path}")
+            return FileResponse(cache_path, media_type="audio/wav")
+        except FileNotFoundError:
+            # Not cached, or evicted by another request or worker; generate it below
+            pass
+        
+        # Check if this is a custom voice (has an embedding)
         if embedding_path.exists():
             # Load the custom speaker embedding
-            target_se = torch.load(embedding_path)
+            target_se = await asyncio.to_thread(torch.load, embedding_path, map_location=device)
             
             # Generate base speech
-            src_path = UPLOAD_DIR / "temp.wav"
-            base_speaker_tts.tts(
+            src_path = UPLOAD_DIR / f"temp_{os.urandom(4).hex()}.wav"
+            await asyncio.to_thread(
+                run_inference,
+                base_speaker_tts.tts,
                 text=request.text,
                 output_path=str(src_path),
                 speaker='default',
@@ -215,20 +359,28 @@ async def generate_speech(request: SpeechRequest):
             )
             
             # Convert to target voice
-            output_path = UPLOAD_DIR / f"generated_{request.voice_id}.wav"
-            source_se = torch.load(str(OPENVOICE_DIR / "checkpoints" / "base_speakers" / "EN" / "en_default_se.pth")).to(target_se.device)
+            output_path = TTS_CACHE_PARTIAL_DIR / f"{cache_path.stem}_{os.urandom(4).hex()}.wav"
+            if device == "cuda":
+                target_se = target_se.half()
             
-            tone_color_converter.convert(
+            await asyncio.to_thread(
+                run_inference,
+                tone_color_converter.convert,
                 audio_src_path=str(src_path),
                 src_se=source_se,
                 tgt_se=target_se,
                 output_path=str(output_path),
                 message="@MyShell"
             )
+            
+            # The intermediate base speech is no longer needed
+            cleanup_files(src_path)
         else:
             # Use the base model with predefined voice
-            output_path = UPLOAD_DIR / f"generated_{request.voice_id}.wav"
-            base_speaker_tts.tts(
+            output_path = TTS_CACHE_PARTIAL_DIR / f"{cache_path.stem}_{os.urandom(4).hex()}.wav"
+            await asyncio.to_thread(
+                run_inference,
+                base_speaker_tts.tts,
                 text=request.text,
                 output_path=str(output_path),
                 speaker=request.voice_id,
@@ -237,51 +389,33 @@ async def generate_speech(request: SpeechRequest):
             )
             
         logger.info(f"Successfully generated speech: {output_path}")
+        await asyncio.to_thread(store_in_tts_cache, output_path, cache_path)
         
-        # Read the generated audio file
-        with open(output_path, "rb") as f:
-            audio_data = f.read()
-            
-        return StreamingResponse(io.BytesIO(audio_data), media_type="audio/wav")
+        # Send the file straight from disk
+        return FileResponse(cache_path, media_type="audio/wav")
     except Exception as e:
         logger.error(f"Error in generate_speech: {str(e)}")
+        cleanup_files(src_path, output_path)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Clean up temporary files
-        if src_path and src_path.exists():
-            try:
-                src_path.unlink()
-            except Exception as e:
-                logger.error(f"Error cleaning up src_path: {e}")
-        if output_path and output_path.exists():
-            try:
-                output_path.unlink()
-            except Exception as e:
-                logger.error(f"Error cleaning up output_path: {e}")
 
 @app.get("/voices")
 async def list_voices():
-    try:
-        if base_speaker_tts is None:
-            raise HTTPException(
-                status_code=500, 
-                detail="OpenVoice models not initialized. Please check the server logs for details."
-            )
-        
-        # Get available speakers from the model's hps
-        voices = [
-            {"id": voice_id, "name": voice_id}
-            for voice_id in base_speaker_tts.hps.speakers.keys()
-        ]
-        logger.info(f"Available voices: {voices}")
-        
-        return {
-            "voices": voices
-        }
-    except Exception as e:
-        logger.error(f"Error in list_voices: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if voices_json is None:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenVoice models not initialized. Please check the server logs for details."
+        )
+    
+    return Response(content=voices_json, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # Pass the app object so the models loaded above aren't loaded again by a
+    # "main:app" import; multi-worker serving goes through start.sh
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools"
+    ) 
\ No newline at end of file
@@ -0,0 +1,15 @@
+#!/usr/bin/env sh
+# Run the OpenVoice service with several worker processes sharing the GPU
+set -e
+cd "$(dirname "$0")"
+
+# NVIDIA MPS lets the workers' CUDA contexts run kernels concurrently
+if command -v nvidia-cuda-mps-control >/dev/null 2>&1; then
+    nvidia-cuda-mps-control -d || echo "MPS control daemon not started (already running?)"
+fi
+
+exec gunicorn main:app \
+    -k uvicorn.workers.UvicornWorker \
+    -w "${WEB_CONCURRENCY:-4}" \
+    --bind "0.0.0.0:${PORT:-8000}" \
+    --timeout 300
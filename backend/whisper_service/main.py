@@ -1,8 +1,11 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import logging
-from transcribe import process_youtube_video
+import os
+import sys
+from transcribe import get_model, stream_youtube_transcription
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +22,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def load_model():
+    # Load Whisper up front so the first request doesn't pay for it
+    get_model()
+
 class TranscriptionRequest(BaseModel):
     url: str
 
@@ -27,14 +35,9 @@ async def transcribe_video(request: TranscriptionRequest):
     try:
         logger.info(f"Received transcription request for URL: {request.url}")
         
-        # Process the video and get transcription
-        transcription = process_youtube_video(request.url)
-        
-        if transcription is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to transcribe video"
-            )
+        # Process the video and collect the transcription as it streams in
+        parts = [text async for text in stream_youtube_transcription(request.url)]
+        transcription = " ".join(parts)
             
         return {
             "status": "success",
@@ -47,6 +50,30 @@ async def transcribe_video(request: TranscriptionRequest):
             detail=str(e)
         )
 
+@app.post("/transcribe/stream")
+async def transcribe_video_stream(request: TranscriptionRequest):
+    logger.info(f"Received streaming transcription request for URL: {request.url}")
+    
+    async def stream_text():
+        try:
+            async for text in stream_youtube_transcription(request.url):
+                yield text + "\n"
+        except Exception as e:
+            # Headers are already sent, so end the body with an error line the
+            # client can tell apart from a complete transcription
+            logger.error(f"Error in transcribe stream endpoint: {e}")
+            yield f"ERROR: {e}\n"
+    
+    # Send each chunk's text as soon as Whisper finishes it
+    return StreamingResponse(stream_text(), media_type="text/plain")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    ) 
\ No newline at end of file
@@ -1,96 +1,205 @@
-import os
-import whisper
+import asyncio
+import threading
+import numpy as np
+import ctranslate2
+from faster_whisper import WhisperModel
 import yt_dlp
-import ffmpeg
-from pathlib import Path
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create directories for storing audio files
-DOWNLOAD_DIR = Path("downloads")
-DOWNLOAD_DIR.mkdir(exist_ok=True)
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
 
-def download_youtube_audio(url, output_path):
+# Audio is fed to Whisper in 30 second chunks of float32 samples
+CHUNK_SECONDS = 30
+CHUNK_BYTES = SAMPLE_RATE * CHUNK_SECONDS * 4
+
+# Long videos are split into 10 minute shards, each fetched by its own ffmpeg
+SHARD_SECONDS = 600
+MAX_PARALLEL_SHARDS = 2
+
+# Whisper model, loaded once and shared across requests
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+
+def get_model():
     """
-    Download audio from YouTube video
+    Return the shared Whisper model, loading it on first use
     """
-    try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-                'preferredquality': '192',
-            }],
-            'outtmpl': str(output_path),
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            logger.info(f"Downloading audio from {url}")
-            ydl.download([url])
-            
-        return True
-    except Exception as e:
-        logger.error(f"Error downloading audio: {e}")
-        return False
+    global _MODEL
+    if _MODEL is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                # Using small model with INT8 weights for faster processing
+                if ctranslate2.get_cuda_device_count() > 0:
+                    device, compute_type = "cuda", "int8_float16"
+                else:
+                    device, compute_type = "cpu", "int8"
+                logger.info(f"Loading Whisper model on {device} ({compute_type})...")
+                # One worker per shard so parallel shards don't serialize on the model
+                _MODEL = WhisperModel(
+                    "small",
+                    device=device,
+                    compute_type=compute_type,
+                    num_workers=MAX_PARALLEL_SHARDS
+                )
+    return _MODEL
 
-def transcribe_audio(audio_path):
+def resolve_audio_stream(url):
     """
-    Transcribe audio using Whisper
+    Resolve the direct audio stream URL, HTTP headers and duration for a YouTube video
+    """
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'quiet': True,
+    }
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        logger.info(f"Resolving audio stream for {url}")
+        info = ydl.extract_info(url, download=False)
+    
+    headers = "".join(f"{key}: {value}\r\n" for key, value in info.get('http_headers', {}).items())
+    return info['url'], headers, info.get('duration')
+
+def transcribe_audio(audio, initial_prompt=None):
+    """
+    Transcribe 16 kHz float32 audio using Whisper, optionally conditioned on preceding text
     """
     try:
-        # Load Whisper model (using small model for faster processing)
-        logger.info("Loading Whisper model...")
-        model = whisper.load_model("small")
+        model = get_model()
         
         # Transcribe the audio
-        logger.info(f"Transcribing audio: {audio_path}")
-        result = model.transcribe(str(audio_path))
+        logger.info(f"Transcribing {len(audio) / SAMPLE_RATE:.1f}s of audio")
+        segments, _ = model.transcribe(
+            audio,
+            beam_size=1,
+            vad_filter=True,
+            initial_prompt=initial_prompt
+        )
         
-        return result["text"]
+        return " ".join(segment.text.strip() for segment in segments)
     except Exception as e:
         logger.error(f"Error transcribing audio: {e}")
         return None
 
-def process_youtube_video(url):
+async def read_audio_chunks(stream_url, headers, queue, start=0, duration=None):
     """
-    Main function to process YouTube video: download and transcribe
+    Fetch and decode part of an audio stream, pushing 30s float32 chunks onto a queue
     """
+    args = ["ffmpeg", "-nostdin", "-loglevel", "error", "-headers", headers]
+    if start:
+        args += ["-ss", str(start)]
+    if duration:
+        args += ["-t", str(duration)]
+    args += [
+        "-i", stream_url,
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE)
     try:
-        # Generate unique filename
-        video_id = url.split("v=")[-1]
-        output_path = DOWNLOAD_DIR / f"{video_id}.%(ext)s"
-        
-        # Download audio
-        if not download_youtube_audio(url, output_path):
-            return None
-            
-        # Get the actual WAV file path
-        wav_path = output_path.with_suffix('.wav')
-        
-        # Transcribe the audio
-        transcription = transcribe_audio(wav_path)
-        
-        # Clean up: remove the downloaded file
+        while True:
+            try:
+                chunk = await process.stdout.readexactly(CHUNK_BYTES)
+            except asyncio.IncompleteReadError as e:
+                chunk = e.partial
+            if chunk:
+                await queue.put(np.frombuffer(chunk, np.float32))
+            if len(chunk) < CHUNK_BYTES:
+                break
+    finally:
+        if process.returncode is None and not process.stdout.at_eof():
+            process.kill()
+        await process.wait()
+    
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+
+async def run_and_close(producer, queue):
+    """
+    Run a producer coroutine and always signal the end of its output with None
+    """
+    try:
+        await producer
+    except asyncio.CancelledError:
+        # Nobody is left to consume the end-of-stream marker
+        raise
+    except Exception:
+        await queue.put(None)
+        raise
+    await queue.put(None)
+
+async def transcribe_shard(stream_url, headers, start, duration, texts, limit):
+    """
+    Transcribe one shard chunk by chunk while the rest of it is still downloading
+    """
+    async with limit:
+        logger.info(f"Transcribing shard starting at {start}s")
+        # Keep at most two chunks buffered ahead of Whisper
+        queue = asyncio.Queue(maxsize=2)
+        reader = asyncio.create_task(
+            run_and_close(read_audio_chunks(stream_url, headers, queue, start, duration), queue)
+        )
         try:
-            os.remove(wav_path)
-            logger.info(f"Cleaned up temporary file: {wav_path}")
-        except Exception as e:
-            logger.warning(f"Could not remove temporary file: {e}")
+            # Chunks of a shard run in order, so each one is conditioned on the
+            # previous chunk's text like Whisper does across a whole file
+            previous_text = None
+            while (chunk := await queue.get()) is not None:
+                text = await asyncio.to_thread(transcribe_audio, chunk, previous_text)
+                if text is None:
+                    raise RuntimeError("Failed to transcribe audio chunk")
+                if text:
+                    await texts.put(text)
+                    previous_text = text
             
-        return transcription
-    except Exception as e:
-        logger.error(f"Error processing video: {e}")
-        return None
+            # Surface download/decode errors once the queue is drained
+            await reader
+        finally:
+            reader.cancel()
+
+async def stream_youtube_transcription(url):
+    """
+    Transcribe a YouTube video, fetching and transcribing shards in parallel
+    and yielding their text in order
+    """
+    stream_url, headers, duration = await asyncio.to_thread(resolve_audio_stream, url)
+    logger.info(f"Streaming audio from {url}")
+    
+    # Without a known duration the whole stream is a single shard
+    if duration:
+        shards = [(start, SHARD_SECONDS) for start in range(0, int(duration) + 1, SHARD_SECONDS)]
+    else:
+        shards = [(0, None)]
+    
+    limit = asyncio.Semaphore(MAX_PARALLEL_SHARDS)
+    outputs = [asyncio.Queue() for _ in shards]
+    tasks = [
+        asyncio.create_task(
+            run_and_close(transcribe_shard(stream_url, headers, start, length, texts, limit), texts)
+        )
+        for (start, length), texts in zip(shards, outputs)
+    ]
+    try:
+        for texts, task in zip(outputs, tasks):
+            while (text := await texts.get()) is not None:
+                yield text
+            await task
+    finally:
+        for task in tasks:
+            task.cancel()
 
 if __name__ == "__main__":
     # Test the transcription
-    test_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
-    result = process_youtube_video(test_url)
-    if result:
-        print("Transcription:", result)
-    else:
-        print("Transcription failed") 
\ No newline at end of file
+    async def main():
+        test_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+        try:
+            parts = [text async for text in stream_youtube_transcription(test_url)]
+            print("Transcription:", " ".join(parts))
+        except Exception as e:
+            print("Transcription failed:", e)
+    
+    asyncio.run(main())
\ No newline at end of file